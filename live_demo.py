@@ -66,15 +66,16 @@ def construct_initial_causal_state(num_points, num_resolutions):
 def preprocess_frames(frames):
   """Preprocess frames to model inputs.
 
+  This runs inside the jitted model functions, so that frames are transferred
+  to the device as uint8 and only converted to float there.
+
   Args:
-    frames: [num_frames, height, width, 3], [0, 255], np.uint8
+    frames: [num_frames, height, width, 3], [0, 255], jnp.uint8
 
   Returns:
-    frames: [num_frames, height, width, 3], [-1, 1], np.float32
+    frames: [num_frames, height, width, 3], [-1, 1], jnp.float32
   """
-  frames = frames.astype(np.float32)
-  frames = frames / 255 * 2 - 1
-  return frames
+  return frames.astype(jnp.float32) * (2.0 / 255.0) - 1.0
 
 
 def postprocess_frames(frames):
@@ -94,17 +95,19 @@ def postprocess_frames(frames):
 def postprocess_occlusions(occlusions, exp_dist):
   """Postprocess occlusions to boolean visible flag.
 
+  Like preprocess_frames, this runs inside the jitted model function, so only
+  the boolean flag is transferred back from the device.
+
   Args:
-    occlusions: [num_points, num_frames], [-inf, inf], np.float32
-    exp_dist: [num_points, num_frames], [-inf, inf], np.float32
+    occlusions: [num_points, num_frames], [-inf, inf], jnp.float32
+    exp_dist: [num_points, num_frames], [-inf, inf], jnp.float32
 
   Returns:
     visibles: [num_points, num_frames], bool
   """
   # visibles = occlusions < 0
-  pred_occ = jax.nn.sigmoid(occlusions)
-  pred_occ = 1 - (1 - pred_occ) * (1 - jax.nn.sigmoid(exp_dist))
-  return pred_occ < 0.5
+  # Note that 1 - sigmoid(x) == sigmoid(-x).
+  return jax.nn.sigmoid(-occlusions) * jax.nn.sigmoid(-exp_dist) > 0.5
 
 
 def load_checkpoint(checkpoint_path):
@@ -114,6 +117,7 @@ def load_checkpoint(checkpoint_path):
 
 def build_online_model_init(frames, points):
   model = tapir_model.TAPIR(use_causal_conv=True)
+  frames = preprocess_frames(frames)
   feature_grids = model.get_feature_grids(frames, is_training=False)
   features = model.get_query_features(
       frames,
@@ -127,6 +131,7 @@ def build_online_model_init(frames, points):
 def build_online_model_predict(frames, features, causal_context):
   """Compute point tracks and occlusions given frames and query points."""
   model = tapir_model.TAPIR(use_causal_conv=True)
+  frames = preprocess_frames(frames)
   feature_grids = model.get_feature_grids(frames, is_training=False)
   trajectories = model.estimate_trajectories(
       frames.shape[-3:-1],
@@ -140,7 +145,11 @@ def build_online_model_predict(frames, features, causal_context):
   )
   causal_context = trajectories["causal_context"]
   del trajectories["causal_context"]
-  return {k: v[-1] for k, v in trajectories.items()}, causal_context
+  prediction = {k: v[-1] for k, v in trajectories.items()}
+  prediction["visible"] = postprocess_occlusions(
+      prediction["occlusion"], prediction["expected_dist"]
+  )
+  return prediction, causal_context
 
 
 def get_frame(video_capture):
@@ -203,20 +212,20 @@ print("Compiling jax functions (this may take a while...)")
 # Call one time to compile
 query_points = jnp.zeros([NUM_POINTS, 3], dtype=jnp.float32)
 query_features, _ = online_init_apply(
-    frames=preprocess_frames(frame[None, None]),
+    frames=frame[None, None],
     points=query_points[None, 0:1],
 )
 jax.block_until_ready(query_features)
 
 query_features, _ = online_init_apply(
-    frames=preprocess_frames(frame[None, None]),
+    frames=frame[None, None],
     points=query_points[None],
 )
 causal_state = construct_initial_causal_state(
     NUM_POINTS, len(query_features.resolutions) - 1
 )
 (prediction, causal_state), _ = online_predict_apply(
-    frames=preprocess_frames(frame[None, None]),
+    frames=frame[None, None],
     features=query_features,
     causal_context=causal_state,
 )
@@ -252,7 +261,7 @@ while rval:
     query_points = jnp.array((0,) + pos, dtype=jnp.float32)
 
     init_query_features, _ = online_init_apply(
-        frames=preprocess_frames(frame[None, None]),
+        frames=frame[None, None],
         points=query_points[None, None],
     )
     init_causal_state = construct_initial_causal_state(
@@ -279,14 +288,12 @@ while rval:
     next_query_idx = (next_query_idx + 1) % NUM_POINTS
   if pos:
     (prediction, causal_state), _ = online_predict_apply(
-        frames=preprocess_frames(frame[None, None]),
+        frames=frame[None, None],
         features=query_features,
         causal_context=causal_state,
     )
     track = prediction["tracks"][0, :, 0]
-    occlusion = prediction["occlusion"][0, :, 0]
-    expected_dist = prediction["expected_dist"][0, :, 0]
-    visibles = postprocess_occlusions(occlusion, expected_dist)
+    visibles = prediction["visible"][0, :, 0]
     track = np.round(track)
 
     for i in range(len(have_point)):
@@ -43,6 +43,10 @@ matplotlib.use('Agg')
 # (num_frames, height, width)
 TRAIN_SIZE = (24, 256, 256)
 
+# Maps each uint8 pixel value to the model's [-1, 1] input range, so that
+# normalizing a video on the host is a single lookup per pixel.
+_UINT8_TO_MODEL_INPUT = np.arange(256, dtype=np.float32) / 255 * 2 - 1
+
 
 class SupervisedPointPrediction(task.Task):
   """A task for predicting point tracks and training on ground-truth.
@@ -492,16 +496,12 @@ class SupervisedPointPrediction(task.Task):
             feature_grid.shape[1:4],
             coordinate_format='tyx',
         )
-        # vmap over channels, duplicating the coordinates
-        vmap_interp = jax.vmap(
-            model_utils.interp, in_axes=(3, None), out_axes=1
-        )
-        # vmap over frames, using the same queries for each frame
-        vmap_interp = jax.vmap(vmap_interp, in_axes=(None, 0), out_axes=0)
-        # vmap over the batch
-        vmap_interp = jax.vmap(vmap_interp)
+        # interp_multichannel samples all channels at every [t, y, x] point of
+        # [num_queries, num_frames]; vmap it over the batch.
         # interp_features is [batch_size,num_queries,num_frames,channels]
-        interp_features = vmap_interp(feature_grid, position_in_grid)
+        interp_features = jax.vmap(model_utils.interp_multichannel)(
+            feature_grid, position_in_grid
+        )
 
         # For each query point, extract the features for the frame which
         # contains the query.
@@ -909,11 +909,8 @@ class SupervisedPointPrediction(task.Task):
 
     def _sample_random_points(frame_max_idx, height, width, num_points):
       """Sample random points with (time, height, width) order."""
-      y = np.random.randint(0, height, (num_points, 1))
-      x = np.random.randint(0, width, (num_points, 1))
-      t = np.random.randint(0, frame_max_idx + 1, (num_points, 1))
-      points = np.concatenate((t, y, x), axis=-1).astype(np.int32)
-      return points
+      high = np.array([frame_max_idx + 1, height, width])
+      return np.random.randint(0, high, (num_points, 3), dtype=np.int32)
 
     config = self.config.inference
     input_video_path = config.input_video_path
@@ -926,14 +923,13 @@ class SupervisedPointPrediction(task.Task):
     num_frames, fps = video.metadata.num_images, video.metadata.fps
     logging.info('resize video to (%s, %s)', resize_height, resize_width)
     video = media.resize_video(video, (resize_height, resize_width))
-    video = video.astype(np.float32) / 255 * 2 - 1
     query_points = _sample_random_points(
         num_frames, resize_height, resize_width, num_points
     )
     occluded = np.zeros((num_points, num_frames), dtype=np.float32)
     inputs = {
         self.input_key: {
-            'video': video[np.newaxis],
+            'video': _UINT8_TO_MODEL_INPUT[video[np.newaxis]],
             'query_points': query_points[np.newaxis],
             'occluded': occluded[np.newaxis],
         }
@@ -949,9 +945,6 @@ class SupervisedPointPrediction(task.Task):
     )
     occluded = outputs['occlusion'] > 0
 
-    video = (video + 1) * 255 / 2
-    video = video.astype(np.uint8)
-
     painted_frames = viz_utils.paint_point_track(
         video,
         outputs['tracks'][0],
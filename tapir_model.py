@@ -396,7 +396,9 @@ class TAPIR(hk.Module):
     pos_rshp = einshape('(tb)hw1->t(b)hw1', pos, t=shape[0])
 
     pos = einshape('t(bn)hw1->bnthw', pos_rshp, b=batch_size, n=num_points)
-    pos = jax.nn.softmax(pos * self.softmax_temperature, axis=(-2, -1))
+    pos = model_utils.unnormalized_softmax(
+        pos * self.softmax_temperature, axis=(-2, -1)
+    )
     points = model_utils.heatmaps_to_points(
         pos, im_shp, query_points=query_points
     )
@@ -464,14 +466,8 @@ class TAPIR(hk.Module):
         # channels
         neighborhood = jax.vmap(  # across batch
             jax.vmap(  # across frames
-                jax.vmap(  # across patch context size
-                    jax.vmap(  # across channels
-                        functools.partial(model_utils.interp, mode='constant'),
-                        in_axes=(-1, None),
-                        out_axes=-1,
-                    ),
-                    in_axes=(None, -2),
-                    out_axes=-2,
+                functools.partial(
+                    model_utils.interp_multichannel, mode='constant'
                 ),
                 in_axes=(0, 1),
                 out_axes=1,
@@ -713,14 +709,7 @@ class TAPIR(hk.Module):
         #
         # interp_features is now [batch, time, num_points, features]
         interp_features = jax.vmap(
-            jax.vmap(
-                jax.vmap(
-                    model_utils.interp,
-                    in_axes=(2, None),
-                    out_axes=-1,
-                ),
-                in_axes=(0, None),
-            )
+            jax.vmap(model_utils.interp_multichannel, in_axes=(0, None))
         )(feature_grid[i], position_in_grid[..., 1:])
         # is_correct_frame is [batch, time, num_points]
         frame_id = jnp.array(
@@ -733,34 +722,18 @@ class TAPIR(hk.Module):
             interp_features * is_correct_frame[..., jnp.newaxis], axis=1
         )
         hires_interp = jax.vmap(
-            jax.vmap(
-                jax.vmap(
-                    model_utils.interp,
-                    in_axes=(2, None),
-                    out_axes=-1,
-                ),
-                in_axes=(0, None),
-            )
+            jax.vmap(model_utils.interp_multichannel, in_axes=(0, None))
         )(hires_feats[i], position_in_grid_hires[..., 1:])
         hires_interp = jnp.sum(
             hires_interp * is_correct_frame[..., jnp.newaxis], axis=1
         )
       else:
-        interp_features = jax.vmap(
-            jax.vmap(
-                model_utils.interp,
-                in_axes=(3, None),
-                out_axes=1,
-            )
-        )(feature_grid[i], position_in_grid)
-
-        hires_interp = jax.vmap(
-            jax.vmap(
-                model_utils.interp,
-                in_axes=(3, None),
-                out_axes=1,
-            )
-        )(hires_feats[i], position_in_grid_hires)
+        interp_features = jax.vmap(model_utils.interp_multichannel)(
+            feature_grid[i], position_in_grid
+        )
+        hires_interp = jax.vmap(model_utils.interp_multichannel)(
+            hires_feats[i], position_in_grid_hires
+        )
 
       hires_query_feats.append(hires_interp)
       query_feats.append(interp_features)
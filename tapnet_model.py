@@ -51,6 +51,7 @@ class TAPNet(hk.Module):
       feature_grid_stride: int = 8,
       num_heads: int = 1,
       cross_replica_axis: Optional[str] = 'i',
+      bfloat16_cost_volume: bool = False,
   ):
     """Initialize the model and provide kwargs for the various components.
 
@@ -59,6 +60,9 @@ class TAPNet(hk.Module):
         supported values are 8 (default), 16, and 32.
       num_heads: Number of heads in the cost volume.
       cross_replica_axis: Which cross replica axis to use for the batch norm.
+      bfloat16_cost_volume: If True, cast the features to bfloat16 before
+        computing the cost volume, accumulating in float32.  This halves the
+        memory traffic of the cost volume einsum at a small cost in precision.
     """
 
     super().__init__()
@@ -66,6 +70,7 @@ class TAPNet(hk.Module):
     self.feature_grid_stride = feature_grid_stride
     self.num_heads = num_heads
     self.softmax_temperature = 10.0
+    self.bfloat16_cost_volume = bfloat16_cost_volume
 
     self.tsm_resnet = tsm_resnet.TSMResNetV2(
         normalize_fn=functools.partial(
@@ -119,13 +124,16 @@ class TAPNet(hk.Module):
 
     The computed cost volume will have shape
       [batch, num_queries, time, height, width, num_heads], which can be very
-      memory intensive.
+      memory intensive.  Its size is bounded by the number of queries passed
+      in, so callers should chunk the queries (see query_chunk_size in
+      __call__).  The heads cannot be split off to save memory, since the
+      first convolution mixes them.
 
     Args:
       interp_feature_heads: A tensor of features for each query point, of shape
-        [batch, num_queries, channels, heads].
+        [batch, heads, num_queries, channels].
       feature_grid_heads: A tensor of features for the video, of shape [batch,
-        time, height, width, channels, heads].
+        heads, time, height, width, channels].
       query_points: When computing tracks, we assume these points are given as
         ground truth and we reproduce them exactly.  This is a set of points of
         shape [batch, num_points, 3], where each entry is [t, y, x] in frame/
@@ -143,9 +151,10 @@ class TAPNet(hk.Module):
     mods = self.cost_volume_track_mods
     # Note: time is first axis to prevent the TPU from padding
     cost_volume = jnp.einsum(
-        'bncd,bthwcd->tbnhwd',
+        'bdnc,bdthwc->tbnhwd',
         interp_feature_heads,
         feature_grid_heads,
+        preferred_element_type=jnp.float32,
     )
     shape = cost_volume.shape
     cost_volume = einshape('tbnhwd->t(bn)hwd', cost_volume)
@@ -154,7 +163,9 @@ class TAPNet(hk.Module):
     occlusion = jax.nn.relu(occlusion)
 
     pos = mods['hid2'](occlusion)
-    pos = jax.nn.softmax(pos * self.softmax_temperature, axis=(-2, -3))
+    pos = model_utils.unnormalized_softmax(
+        pos * self.softmax_temperature, axis=(-2, -3)
+    )
     pos = einshape('t(bn)hw1->bnthw', pos, n=shape[2])
     points = model_utils.heatmaps_to_points(
         pos, im_shp, query_points=query_points
@@ -165,9 +176,7 @@ class TAPNet(hk.Module):
     occlusion = mods['hid4'](occlusion)
     occlusion = jax.nn.relu(occlusion)
     occlusion = mods['occ_out'](occlusion)
-    occlusion = jnp.transpose(occlusion, (1, 0, 2))
-    assert occlusion.shape[1] == shape[0]
-    occlusion = jnp.reshape(occlusion, (shape[1], shape[2], shape[0]))
+    occlusion = einshape('t(bn)1->bnt', occlusion, n=shape[2])
     return points, occlusion
 
   def __call__(
@@ -192,7 +201,9 @@ class TAPNet(hk.Module):
       compute_regression: if True, compute tracks using cost volumes; otherwise
         simply compute features (required for the baseline)
       query_chunk_size: When computing cost volumes, break the queries into
-        chunks of this size to save memory.
+        chunks of this size to save memory.  If there are more queries than
+        this, they are zero-padded internally to a multiple of this size, so
+        that every chunk has the same shape.
       get_query_feats: If True, also return the features for each query obtained
         using bilinear interpolation from the feature grid
       feature_grid: If specified, use this as the feature grid rather than
@@ -238,41 +249,65 @@ class TAPNet(hk.Module):
         feature_grid.shape[1:4],
         coordinate_format='tyx',
     )
-    interp_features = jax.vmap(
-        jax.vmap(
-            model_utils.interp,
-            in_axes=(3, None),
-            out_axes=1,
-        )
-    )(feature_grid, position_in_grid)
+    interp_features = jax.vmap(model_utils.interp_multichannel)(
+        feature_grid, position_in_grid
+    )
+    # Heads are kept as a leading axis (with the channels of each head
+    # contiguous), so that the cost volume einsum is a plain batched matmul
+    # over heads.
     feature_grid_heads = einshape(
-        'bthw(cd)->bthwcd', feature_grid, d=self.num_heads
+        'bthw(cd)->bdthwc', feature_grid, d=self.num_heads
     )
     interp_features_heads = einshape(
-        'bn(cd)->bncd',
+        'bn(cd)->bdnc',
         interp_features,
         d=self.num_heads,
     )
+    if self.bfloat16_cost_volume:
+      # The features are unit-normalized, so they lose little precision in
+      # bfloat16; the cost volume itself is still accumulated in float32.
+      feature_grid_heads = feature_grid_heads.astype(jnp.bfloat16)
+      interp_features_heads = interp_features_heads.astype(jnp.bfloat16)
     out = {'feature_grid': feature_grid}
     if get_query_feats:
       out['query_feats'] = interp_features
 
     if compute_regression:
       assert query_chunk_size is not None
-      all_occ = []
-      all_pts = []
+      # The cost volume head is deliberately not wrapped in hk.remat: the
+      # cost volume einsum is the most expensive op in the model, and
+      # rematerializing it would recompute it on the backward pass.
       infer = functools.partial(self.tracks_from_cost_volume, im_shp=shape)
 
-      for i in range(0, query_points.shape[1], query_chunk_size):
-        points, occlusion = infer(
-            interp_features_heads[:, i:i + query_chunk_size],
-            feature_grid_heads,
-            query_points[:, i:i + query_chunk_size],
-        )
-        all_occ.append(occlusion)
-        all_pts.append(points)
-      occlusion = jnp.concatenate(all_occ, axis=1)
-      points = jnp.concatenate(all_pts, axis=1)
+      # Pad the queries up to a multiple of the chunk size so that every chunk
+      # has the same static shape.  The chunks are then processed by a single
+      # scan (compiled once) rather than an unrolled Python loop, and the
+      # padded queries are sliced off the result.  The chunk never exceeds
+      # the number of queries, so small query sets are not padded up.
+      num_queries = query_points.shape[1]
+      chunk_size = min(query_chunk_size, num_queries)
+      num_pad = -num_queries % chunk_size
+      chunked_feats = einshape(
+          'bd(ks)c->kbdsc',
+          jnp.pad(
+              interp_features_heads, ((0, 0), (0, 0), (0, num_pad), (0, 0))
+          ),
+          s=chunk_size,
+      )
+      chunked_query_points = einshape(
+          'b(ks)i->kbsi',
+          jnp.pad(query_points, ((0, 0), (0, num_pad), (0, 0))),
+          s=chunk_size,
+      )
+
+      def infer_chunk(carry, chunk):
+        return carry, infer(chunk[0], feature_grid_heads, chunk[1])
+
+      _, (points, occlusion) = hk.scan(
+          infer_chunk, None, (chunked_feats, chunked_query_points)
+      )
+      points = einshape('kbsti->b(ks)ti', points)[:, :num_queries]
+      occlusion = einshape('kbst->b(ks)t', occlusion)[:, :num_queries]
 
       out['occlusion'] = occlusion
       out['tracks'] = points
@@ -15,7 +15,9 @@
 
 """Utilities and losses for building and training TAP models."""
 
-from typing import Optional
+import functools
+import itertools
+from typing import Optional, Sequence
 
 import chex
 import jax
@@ -96,6 +98,75 @@ def interp(x: chex.Array, y: chex.Array, mode: str = 'nearest') -> chex.Array:
   )
 
 
+def interp_multichannel(
+    x: chex.Array, y: chex.Array, mode: str = 'nearest'
+) -> chex.Array:
+  """Bilinear interpolation of every channel of a feature grid at once.
+
+  This is equivalent to vmapping interp over the trailing channel axis of x,
+  but the corner indices and weights are computed once and shared across all
+  channels, so it lowers to one wide gather per corner rather than a
+  map_coordinates call per channel.
+
+  Args:
+    x: Grid of features to be interpolated, of shape [height, width, channels]
+      or [time, height, width, channels].
+    y: Points to be interpolated, of shape [..., 2] or [..., 3], using the same
+      conventions as interp.  Any leading dimensions are kept in the output.
+    mode: How to deal with samples outside the range; either 'nearest', which
+      clamps to the border, or 'constant', which treats the grid as zero
+      outside its bounds.
+
+  Returns:
+    The interpolated values, of shape [..., channels].
+
+  Raises:
+    ValueError: if mode is not supported.
+  """
+  if mode not in ('nearest', 'constant'):
+    raise ValueError(f'Unsupported interpolation mode {mode}.')
+  if y.shape[-1] == 3:
+    y = jnp.concatenate([y[..., 0:1], y[..., 1:] - 0.5], axis=-1)
+  else:
+    y = y - 0.5
+
+  lower = jnp.floor(y)
+  upper_weight = y - lower
+  lower = lower.astype(jnp.int32)
+  result = 0.0
+  for corner in itertools.product((0, 1), repeat=y.shape[-1]):
+    weight = 1.0
+    indices = []
+    for dim, offset in enumerate(corner):
+      index = lower[..., dim] + offset
+      if offset:
+        dim_weight = upper_weight[..., dim]
+      else:
+        dim_weight = 1.0 - upper_weight[..., dim]
+      if mode == 'constant':
+        dim_weight *= (index >= 0) & (index < x.shape[dim])
+      weight *= dim_weight
+      indices.append(jnp.clip(index, 0, x.shape[dim] - 1))
+    result += weight[..., jnp.newaxis] * x[tuple(indices)]
+  return result
+
+
+@functools.lru_cache(maxsize=4)
+def _grid_cell_centers(height: int, width: int) -> np.ndarray:
+  """Returns the [x, y] center of every cell of a grid, of shape [h, w, 2].
+
+  The result is a NumPy array, so it is embedded in traced computations as a
+  constant, and it is cached since the grid size rarely changes.
+  """
+  x, y = np.meshgrid(
+      np.arange(width, dtype=np.float32),
+      np.arange(height, dtype=np.float32),
+  )
+  coords = np.stack([x + 0.5, y + 0.5], axis=-1)
+  coords.flags.writeable = False
+  return coords
+
+
 def soft_argmax_heatmap(
     softmax_val: chex.Array,
     threshold: chex.Numeric = 5,
@@ -103,40 +174,67 @@ def soft_argmax_heatmap(
   """Computes the soft argmax a heatmap.
 
   Finds the argmax grid cell, and then returns the average coordinate of
-  surrounding grid cells, weighted by the softmax.
+  surrounding grid cells, weighted by the softmax.  Any leading dimensions are
+  treated as batch dimensions, so a whole batch of heatmaps is reduced at once
+  rather than vmapping over individual heatmaps.
 
   Args:
-    softmax_val: A heatmap of shape [height, width], containing all positive
-      values summing to 1 across the entire grid.
+    softmax_val: A heatmap of shape [..., height, width], containing all
+      positive values.  Each heatmap typically sums to 1, but the result is
+      unchanged by rescaling it.
     threshold: The radius of surrounding cells to consider when computing the
       average.
 
   Returns:
-    The soft argmax, which is a single point [x,y] in grid coordinates.
+    The soft argmax, of shape [..., 2], where each point is [x,y] in grid
+      coordinates.
   """
-  x, y = jnp.meshgrid(
-      jnp.arange(softmax_val.shape[1]),
-      jnp.arange(softmax_val.shape[0]),
+  coords = jnp.asarray(
+      _grid_cell_centers(softmax_val.shape[-2], softmax_val.shape[-1])
   )
-  coords = jnp.stack([x + 0.5, y + 0.5], axis=-1)
-  argmax_pos = jnp.argmax(jnp.reshape(softmax_val, -1))
-  pos = jnp.reshape(coords, [-1, 2])[argmax_pos, jnp.newaxis, jnp.newaxis, :]
+  argmax_pos = jnp.argmax(
+      jnp.reshape(softmax_val, softmax_val.shape[:-2] + (-1,)), axis=-1
+  )
+  pos = jnp.reshape(coords, [-1, 2])[argmax_pos]
   valid = jnp.sum(
-      jnp.square(coords - pos),
+      jnp.square(coords - pos[..., jnp.newaxis, jnp.newaxis, :]),
       axis=-1,
       keepdims=True,
   ) < jnp.square(threshold)
   weighted_sum = jnp.sum(
-      coords * valid * softmax_val[:, :, jnp.newaxis],
-      axis=(0, 1),
+      coords * valid * softmax_val[..., jnp.newaxis],
+      axis=(-3, -2),
   )
   sum_of_weights = jnp.maximum(
-      jnp.sum(valid * softmax_val[:, :, jnp.newaxis], axis=(0, 1)),
+      jnp.sum(valid * softmax_val[..., jnp.newaxis], axis=(-3, -2)),
       1e-12,
   )
   return weighted_sum / sum_of_weights
 
 
+def unnormalized_softmax(
+    logits: chex.Array, axis: Sequence[int]
+) -> chex.Array:
+  """Computes a softmax without dividing by the normalizer.
+
+  Consumers like heatmaps_to_points only depend on relative values within
+  each heatmap, so the normalizing sum (and a full pass to divide by it) can
+  be skipped.  The max is subtracted for numerical stability; it cancels out
+  of any scale-invariant consumer, so no gradient flows through it.
+
+  Args:
+    logits: The logits to exponentiate.
+    axis: The axis or axes over which the softmax would be computed.
+
+  Returns:
+    exp(logits - max(logits)), of the same shape as logits.
+  """
+  return jnp.exp(
+      logits
+      - jax.lax.stop_gradient(jnp.max(logits, axis=axis, keepdims=True))
+  )
+
+
 def heatmaps_to_points(
     all_pairs_softmax: chex.Array,
     image_shape: chex.Shape,
@@ -150,7 +248,8 @@ def heatmaps_to_points(
 
   Args:
     all_pairs_softmax: A set of heatmaps, of shape [batch, num_points, time,
-      height, width].
+      height, width].  The heatmaps need not be normalized, since the soft
+      argmax only depends on relative values within each heatmap.
     image_shape: The shape of the original image that the feature grid was
       extracted from.  This is needed to properly normalize coordinates.
     threshold: Threshold for the soft argmax operation.
@@ -165,12 +264,9 @@ def heatmaps_to_points(
       where the query point is specified, in which case the query points are
       returned verbatim.
   """
-  # soft_argmax_heatmap operates over a single heatmap.  We vmap it across
-  # batch, num_points, and frames.
-  vmap_sah = soft_argmax_heatmap
-  for _ in range(3):
-    vmap_sah = jax.vmap(vmap_sah, (0, None))
-  out_points = vmap_sah(all_pairs_softmax, threshold)
+  # soft_argmax_heatmap treats batch, num_points, and frames as batch
+  # dimensions, so every heatmap is reduced in a single op.
+  out_points = soft_argmax_heatmap(all_pairs_softmax, threshold)
 
   feature_grid_shape = all_pairs_softmax.shape[1:]
   # Note: out_points is now [x, y]; we need to divide by [width, height].
@@ -182,24 +278,21 @@ def heatmaps_to_points(
   )
   assert feature_grid_shape[1] == image_shape[1]
   if query_points is not None:
-    # The [..., 0:1] is because we only care about the frame index.
-    query_frame = transforms.convert_grid_coordinates(
-        query_points,
-        image_shape[1:4],
-        feature_grid_shape[1:4],
-        coordinate_format='tyx',
-    )[..., 0:1]
-    query_frame = jnp.array(jnp.round(query_frame), jnp.int32)
-    frame_indices = jnp.arange(image_shape[1], dtype=jnp.int32)[
-        jnp.newaxis, jnp.newaxis, :
-    ]
-    is_query_point = query_frame == frame_indices
-
-    is_query_point = is_query_point[:, :, :, jnp.newaxis]
-    out_points = (
-        out_points * (1 - is_query_point)
-        + query_points[:, :, jnp.newaxis, 2:0:-1] * is_query_point
-    )
+    # Only the frame index of the query points is needed, and the feature grid
+    # has the same number of frames as the image (asserted above), so there is
+    # no need to convert the y/x coordinates to the feature grid.
+    query_frame = jnp.array(jnp.round(query_points[..., 0]), jnp.int32)
+    # Overwrite the prediction on each query's own frame with a scatter, rather
+    # than building a [batch, num_points, time] mask and blending with it.
+    # Indexing wraps negative indices before mode='drop' applies, so move
+    # negative frames past the end to make sure they are dropped too.
+    query_frame = jnp.where(query_frame < 0, image_shape[1], query_frame)
+    batch_size, num_points = query_frame.shape
+    out_points = out_points.at[
+        jnp.arange(batch_size)[:, jnp.newaxis],
+        jnp.arange(num_points)[jnp.newaxis, :],
+        query_frame,
+    ].set(query_points[..., 2:0:-1], mode='drop')
 
   return out_points
 
@@ -72,7 +72,8 @@ def convert_grid_coordinates(
   else:
     raise ValueError('Recognized coordinate formats are xy and tyx.')
 
-  position_in_grid = coords
-  position_in_grid = position_in_grid * output_grid_size / input_grid_size
+  # The conversion is a per-axis scale, so compute the (tiny) scale vector
+  # first and apply it to the coordinates with a single multiply.
+  position_in_grid = coords * (output_grid_size / input_grid_size)
 
   return position_in_grid
@@ -73,6 +73,21 @@ def paint_point_track(
   icon3 = np.pad(icon, [(0, 1), (1, 0), (0, 0)])
   icon4 = np.pad(icon, [(1, 0), (1, 0), (0, 0)])
 
+  # The icon is centered at the center of a pixel, but the input coordinates
+  # are raster coordinates.  Therefore, to render a point at (1,1) (which
+  # lies on the corner between four pixels), we need 1/4 of the icon placed
+  # centered on the 0'th row, 0'th column, etc.  We need to subtract
+  # 0.5 to make the fractional position come out right.
+  #
+  # Drawing proceeds frame by frame, so transpose the tracks to be frame-major
+  # once, rather than striding through the point-major arrays for every point.
+  point_tracks = np.ascontiguousarray(np.transpose(point_tracks, (1, 0, 2)))
+  point_tracks = point_tracks + 0.5
+  xs = np.clip(point_tracks[..., 0], 0.0, width)
+  ys = np.clip(point_tracks[..., 1], 0.0, height)
+  visibles = np.ascontiguousarray(np.transpose(visibles))
+  colormap = np.array(colormap)
+
   video = frames.copy()
   for t in range(num_frames):
     # Pad so that points that extend outside the image frame don't crash us
@@ -84,37 +99,28 @@ def paint_point_track(
             (0, 0),
         ],
     )
-    for i in range(num_points):
-      # The icon is centered at the center of a pixel, but the input coordinates
-      # are raster coordinates.  Therefore, to render a point at (1,1) (which
-      # lies on the corner between four pixels), we need 1/4 of the icon placed
-      # centered on the 0'th row, 0'th column, etc.  We need to subtract
-      # 0.5 to make the fractional position come out right.
-      x, y = point_tracks[i, t, :] + 0.5
-      x = min(max(x, 0.0), width)
-      y = min(max(y, 0.0), height)
-
-      if visibles[i, t]:
-        x1, y1 = np.floor(x).astype(np.int32), np.floor(y).astype(np.int32)
-        x2, y2 = x1 + 1, y1 + 1
+    for i in np.flatnonzero(visibles[t]):
+      x, y = xs[t, i], ys[t, i]
+      x1, y1 = np.floor(x).astype(np.int32), np.floor(y).astype(np.int32)
+      x2, y2 = x1 + 1, y1 + 1
 
-        # bilinear interpolation
-        patch = (
-            icon1 * (x2 - x) * (y2 - y)
-            + icon2 * (x2 - x) * (y - y1)
-            + icon3 * (x - x1) * (y2 - y)
-            + icon4 * (x - x1) * (y - y1)
-        )
-        x_ub = x1 + 2 * radius + 2
-        y_ub = y1 + 2 * radius + 2
-        image[y1:y_ub, x1:x_ub, :] = (1 - patch) * image[
-            y1:y_ub, x1:x_ub, :
-        ] + patch * np.array(colormap[i])[np.newaxis, np.newaxis, :]
+      # bilinear interpolation
+      patch = (
+          icon1 * (x2 - x) * (y2 - y)
+          + icon2 * (x2 - x) * (y - y1)
+          + icon3 * (x - x1) * (y2 - y)
+          + icon4 * (x - x1) * (y - y1)
+      )
+      x_ub = x1 + 2 * radius + 2
+      y_ub = y1 + 2 * radius + 2
+      image[y1:y_ub, x1:x_ub, :] = (1 - patch) * image[
+          y1:y_ub, x1:x_ub, :
+      ] + patch * colormap[i][np.newaxis, np.newaxis, :]
 
-      # Remove the pad
-      video[t] = image[
-          radius + 1 : -radius - 1, radius + 1 : -radius - 1
-      ].astype(np.uint8)
+    # Remove the pad
+    video[t] = image[
+        radius + 1 : -radius - 1, radius + 1 : -radius - 1
+    ].astype(np.uint8)
   return video
 
 
@@ -261,13 +267,11 @@ def write_visualization(
     )
 
     logging.info('writing...')
-    with media.VideoWriter(
+    # Convert the whole clip at once rather than casting frame by frame.
+    media.write_video(
         visualization_path[i],
-        shape=video_frames.shape[-3:-1],
+        video_frames.astype(np.uint8),
         fps=5,
         codec='h264',
         bps=600000,
-    ) as video_writer:
-      for j in range(video_frames.shape[0]):
-        fr = video_frames[j]
-        video_writer.add_image(fr.astype(np.uint8))
+    )